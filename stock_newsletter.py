@@ -4,14 +4,25 @@ Author: Senior Full-Stack Developer
 Version: 1.0.0
 """
 
+import logging
+import multiprocessing
 import os
 import re
+import threading
+from html import escape
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Union
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # 비대화형 백엔드 (GUI 백엔드 탐색 생략)
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import matplotlib.font_manager as fm
 import google.generativeai as genai
 from dataclasses import dataclass
@@ -19,29 +30,98 @@ import json
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from numba import njit
+except ImportError:  # numba 미설치 시 NumPy 경로만 사용
+    njit = None
+
+# 로깅 설정 (핸들러 구성은 main()에서, 라이브러리로 사용 시 호출 측 설정을 따름)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
 # 한글 폰트 설정
 plt.rcParams['font.family'] = 'DejaVu Sans'
 plt.rcParams['axes.unicode_minus'] = False
 
+# 테이블 필드명 -> DataFrame 표시용 컬럼명
+_INDEX_COLS = {
+    'index_name': '지수명',
+    'current_value': '현재가',
+    'change_value': '전일대비',
+    'change_rate': '등락률(%)',
+}
+_STOCK_COLS = {
+    'rank': '순위',
+    'name': '종목명',
+    'current_price': '현재가',
+    'change_rate': '등락률(%)',
+}
+
+# PNG 저장 옵션 (뉴스레터용 차트는 낮은 압축 수준으로 인코딩 시간 단축)
+PNG_SAVE_KWARGS = {'compress_level': 1, 'optimize': False}
+
 
 @dataclass
-class MarketData:
-    """시장 데이터 구조"""
-    index_name: str
-    current_value: float
-    change_value: float
-    change_rate: float
+class IndexTable:
+    """시장 지수 데이터 구조 (컬럼 단위 배열)"""
+    index_name: np.ndarray
+    current_value: np.ndarray
+    change_value: np.ndarray
+    change_rate: np.ndarray
     timestamp: str
+    
+    @classmethod
+    def allocate(cls, n: int, timestamp: str = '') -> 'IndexTable':
+        """n개 지수를 담을 빈 배열 할당"""
+        return cls(
+            index_name=np.empty(n, dtype=object),
+            current_value=np.empty(n, dtype=np.float64),
+            change_value=np.empty(n, dtype=np.float64),
+            change_rate=np.empty(n, dtype=np.float64),
+            timestamp=timestamp
+        )
 
 
 @dataclass
-class StockItem:
-    """개별 주식 데이터 구조"""
-    rank: int
-    name: str
-    current_price: int
-    change_rate: float
+class StockTable:
+    """상승/하락 종목 데이터 구조 (컬럼 단위 배열)"""
+    rank: np.ndarray
+    name: np.ndarray
+    current_price: np.ndarray
+    change_rate: np.ndarray
     category: str  # 'rise' or 'fall'
+    
+    @classmethod
+    def allocate(cls, n: int, category: str) -> 'StockTable':
+        """n개 종목을 담을 빈 배열 할당"""
+        return cls(
+            rank=np.empty(n, dtype=np.int64),
+            name=np.empty(n, dtype=object),
+            current_price=np.empty(n, dtype=np.int64),
+            change_rate=np.empty(n, dtype=np.float64),
+            category=category
+        )
+    
+    def select(self, idx: np.ndarray) -> 'StockTable':
+        """idx 순서대로 종목을 선택하고 순위를 1부터 다시 매김"""
+        return StockTable(
+            rank=np.arange(1, len(idx) + 1, dtype=np.int64),
+            name=self.name[idx],
+            current_price=self.current_price[idx],
+            change_rate=self.change_rate[idx],
+            category=self.category
+        )
+
+
+def top_k_by_rate(arr: np.ndarray, k: int, ascending: bool = False) -> np.ndarray:
+    """등락률 배열에서 상위 k개 인덱스를 정렬된 순서로 반환 (부분 정렬, O(N + k log k))"""
+    keys = arr if ascending else -arr
+    k = min(k, keys.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    
+    idx = np.argpartition(keys, k - 1)[:k]
+    return idx[np.argsort(keys[idx])]
 
 
 class StockDataCollector:
@@ -52,71 +132,93 @@ class StockDataCollector:
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+        
+        # 스레드별 세션 (병렬 수집 시 커넥션 재사용)
+        self._local = threading.local()
+    
+    @property
+    def session(self) -> requests.Session:
+        """현재 스레드 전용 HTTP 세션 (커넥션 풀 + 재시도 정책 적용)"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=8,
+                pool_maxsize=16,
+                max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504))
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._local.session = session
+        return session
     
-    def collect_market_indices(self) -> List[MarketData]:
+    def _fetch_soup(self, url: str) -> BeautifulSoup:
+        """페이지 요청 후 HTML 파싱"""
+        response = self.session.get(url, headers=self.headers, timeout=10)
+        response.raise_for_status()
+        return BeautifulSoup(response.content, 'lxml')
+    
+    def collect_market_indices(self) -> IndexTable:
         """주요 지수 정보 수집"""
         try:
             url = f"{self.base_url}/index.naver"
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            indices_data = []
+            soup = self._fetch_soup(url)
             
             # 주요 지수 파싱 (코스피, 코스닥, 코스피200)
             index_names = ['KOSPI', 'KOSDAQ', 'KOSPI200']
+            indices = IndexTable.allocate(
+                len(index_names),
+                timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            )
             
-            for idx_name in index_names:
-                try:
-                    # 실제 네이버 증권 모바일 구조에 맞춰 파싱
-                    # 예시 데이터 구조 (실제 HTML 구조에 따라 조정 필요)
-                    indices_data.append(MarketData(
-                        index_name=idx_name,
-                        current_value=2500.0,  # 실제 파싱 데이터로 대체
-                        change_value=10.5,
-                        change_rate=0.42,
-                        timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    ))
-                except Exception as e:
-                    print(f"지수 {idx_name} 파싱 오류: {e}")
+            for i, idx_name in enumerate(index_names):
+                # 실제 네이버 증권 모바일 구조에 맞춰 파싱
+                # 예시 데이터 구조 (실제 HTML 구조에 따라 조정 필요)
+                indices.index_name[i] = idx_name
+                indices.current_value[i] = 2500.0  # 실제 파싱 데이터로 대체
+                indices.change_value[i] = 10.5
+                indices.change_rate[i] = 0.42
             
-            return indices_data
+            return indices
         except Exception as e:
-            print(f"시장 지수 수집 오류: {e}")
-            return []
+            logger.error("시장 지수 수집 오류: %s", e)
+            return IndexTable.allocate(0)
     
-    def collect_top_stocks(self, category: str = 'rise') -> List[StockItem]:
+    def collect_top_stocks(self, category: str = 'rise') -> StockTable:
         """상승/하락 상위 종목 수집"""
         try:
             # 상승률 상위 또는 하락률 상위
             url = f"{self.base_url}/sise/sise_rise.naver" if category == 'rise' else f"{self.base_url}/sise/sise_fall.naver"
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            stocks = []
+            soup = self._fetch_soup(url)
             
             # 실제 파싱 로직 (예시 데이터)
             sample_stocks = [
-                StockItem(1, "삼성전자", 75000, 5.2, category),
-                StockItem(2, "SK하이닉스", 142000, 4.8, category),
-                StockItem(3, "현대차", 185000, 3.9, category),
-                StockItem(4, "LG에너지솔루션", 420000, 3.5, category),
-                StockItem(5, "POSCO홀딩스", 385000, 3.2, category),
+                (1, "삼성전자", 75000, 5.2),
+                (2, "SK하이닉스", 142000, 4.8),
+                (3, "현대차", 185000, 3.9),
+                (4, "LG에너지솔루션", 420000, 3.5),
+                (5, "POSCO홀딩스", 385000, 3.2),
             ]
             
-            return sample_stocks[:10]  # 상위 10개
+            pool = StockTable.allocate(len(sample_stocks), category)
+            for i, (rank, name, price, rate) in enumerate(sample_stocks):
+                pool.rank[i] = rank
+                pool.name[i] = name
+                pool.current_price[i] = price
+                pool.change_rate[i] = rate
+            
+            # 상위 10개 (하락 종목은 등락률 오름차순)
+            top = top_k_by_rate(pool.change_rate, 10, ascending=(category == 'fall'))
+            return pool.select(top)
         except Exception as e:
-            print(f"종목 정보 수집 오류: {e}")
-            return []
+            logger.error("종목 정보 수집 오류: %s", e)
+            return StockTable.allocate(0, category)
     
     def collect_market_news(self) -> List[Dict[str, str]]:
         """시장 주요 뉴스 수집"""
         try:
             url = f"{self.base_url}/news/news_list.naver?mode=LSS2D&section_id=101&section_id2=258"
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = self._fetch_soup(url)
             
             news_list = []
             
@@ -129,48 +231,116 @@ class StockDataCollector:
             
             return sample_news[:5]
         except Exception as e:
-            print(f"뉴스 수집 오류: {e}")
+            logger.error("뉴스 수집 오류: %s", e)
             return []
 
 
+def _render_bar_png(title: str, labels: List[str], values: List[float],
+                    colors, path: str, zero_line: bool = False) -> str:
+    """가로 막대 차트를 PNG로 저장 (프로세스 풀에서 실행되는 모듈 레벨 함수)"""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    
+    ax.barh(labels, values, color=colors, alpha=0.7)
+    ax.set_xlabel('Change Rate (%)', fontsize=12)
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    if zero_line:
+        ax.axvline(x=0, color='black', linestyle='-', linewidth=0.5)
+    ax.grid(axis='x', alpha=0.3)
+    
+    fig.tight_layout()
+    fig.savefig(path, dpi=100, bbox_inches='tight', pil_kwargs=PNG_SAVE_KWARGS)
+    return path
+
+
+def bar_svg(labels: List[str], values: List[float], colors, title: str,
+            width: int = 800, height: int = 400) -> str:
+    """가로 막대 차트를 SVG 문자열로 생성 (matplotlib 없이 막대 좌표를 직접 계산)"""
+    margin_left, margin_right, margin_top, margin_bottom = 160, 60, 50, 50
+    plot_w = width - margin_left - margin_right
+    plot_h = height - margin_top - margin_bottom
+    if isinstance(colors, str):
+        colors = [colors] * len(values)
+    
+    # 0을 포함하도록 x축 범위 설정
+    v_min = min([0.0, *values])
+    v_max = max([0.0, *values])
+    if v_max == v_min:
+        v_max = v_min + 1.0
+    pad = (v_max - v_min) * 0.15  # 막대 끝 값 라벨 공간
+    v_min, v_max = (v_min - pad if v_min < 0 else v_min), v_max + pad
+    
+    def x_of(v: float) -> float:
+        return margin_left + (v - v_min) / (v_max - v_min) * plot_w
+    
+    x0 = x_of(0.0)
+    slot = plot_h / max(len(values), 1)
+    bar_h = slot * 0.8
+    
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="sans-serif">',
+        f'<rect width="{width}" height="{height}" fill="white"/>',
+        f'<text x="{width / 2:.1f}" y="30" font-size="18" font-weight="bold" '
+        f'text-anchor="middle">{escape(title)}</text>',
+    ]
+    
+    # 위에서부터 순서대로 막대 배치
+    for i, (label, value, color) in enumerate(zip(labels, values, colors)):
+        y = margin_top + i * slot + (slot - bar_h) / 2
+        x_end = x_of(value)
+        cy = y + bar_h / 2
+        parts.append(
+            f'<rect x="{min(x0, x_end):.1f}" y="{y:.1f}" width="{abs(x_end - x0):.1f}" '
+            f'height="{bar_h:.1f}" fill="{color}" fill-opacity="0.7"/>'
+        )
+        parts.append(
+            f'<text x="{margin_left - 8}" y="{cy:.1f}" font-size="13" text-anchor="end" '
+            f'dominant-baseline="middle">{escape(str(label))}</text>'
+        )
+        anchor, offset = ('start', 4) if value >= 0 else ('end', -4)
+        parts.append(
+            f'<text x="{x_end + offset:.1f}" y="{cy:.1f}" font-size="12" text-anchor="{anchor}" '
+            f'dominant-baseline="middle">{value:.2f}%</text>'
+        )
+    
+    parts.extend([
+        f'<line x1="{x0:.1f}" y1="{margin_top}" x2="{x0:.1f}" y2="{margin_top + plot_h}" '
+        f'stroke="black" stroke-width="1"/>',
+        f'<text x="{margin_left + plot_w / 2:.1f}" y="{height - 15}" font-size="14" '
+        f'text-anchor="middle">Change Rate (%)</text>',
+        '</svg>',
+    ])
+    return '\n'.join(parts)
+
+
+def _rate_extremes(rising_rates: np.ndarray, falling_rates: np.ndarray):
+    """상승 종목 최대 등락률과 하락 종목 최소 등락률 계산"""
+    max_rate = rising_rates.max() if rising_rates.size else 0.0
+    min_rate = falling_rates.min() if falling_rates.size else 0.0
+    return max_rate, min_rate
+
+
+# numba가 설치된 경우 대규모 종목 풀용 JIT 커널 준비
+JIT_MIN_SIZE = 10_000
+_rate_extremes_jit = njit(cache=True)(_rate_extremes) if njit else None
+
+
 class DataProcessor:
     """데이터 정제 및 분석 클래스"""
     
     @staticmethod
-    def process_market_data(indices: List[MarketData], 
-                           rising_stocks: List[StockItem],
-                           falling_stocks: List[StockItem]) -> Dict:
+    def process_market_data(indices: IndexTable, 
+                           rising_stocks: StockTable,
+                           falling_stocks: StockTable) -> Dict:
         """수집된 데이터를 DataFrame으로 정제"""
         
         # 지수 데이터프레임
-        indices_df = pd.DataFrame([
-            {
-                '지수명': idx.index_name,
-                '현재가': idx.current_value,
-                '전일대비': idx.change_value,
-                '등락률(%)': idx.change_rate
-            } for idx in indices
-        ])
-        
-        # 상승 종목 데이터프레임
-        rising_df = pd.DataFrame([
-            {
-                '순위': stock.rank,
-                '종목명': stock.name,
-                '현재가': stock.current_price,
-                '등락률(%)': stock.change_rate
-            } for stock in rising_stocks
-        ])
-        
-        # 하락 종목 데이터프레임
-        falling_df = pd.DataFrame([
-            {
-                '순위': stock.rank,
-                '종목명': stock.name,
-                '현재가': stock.current_price,
-                '등락률(%)': stock.change_rate
-            } for stock in falling_stocks
-        ])
+        indices_df = DataProcessor._table_to_frame(indices, _INDEX_COLS)
+        
+        # 상승/하락 종목 데이터프레임
+        rising_df = DataProcessor._table_to_frame(rising_stocks, _STOCK_COLS)
+        falling_df = DataProcessor._table_to_frame(falling_stocks, _STOCK_COLS)
         
         return {
             'indices': indices_df,
@@ -179,57 +349,63 @@ class DataProcessor:
         }
     
     @staticmethod
-    def create_visualizations(data_dict: Dict, output_dir: str = '/mnt/user-data/outputs') -> List[str]:
-        """데이터 시각화 생성"""
+    def _table_to_frame(table, columns: Dict[str, str]) -> pd.DataFrame:
+        """컬럼 배열 테이블을 표시용 컬럼명의 DataFrame으로 변환"""
+        return pd.DataFrame({label: getattr(table, field) for field, label in columns.items()})
+    
+    @staticmethod
+    def create_visualizations(data_dict: Dict, output_dir: str = '/mnt/user-data/outputs',
+                              image_format: str = 'svg') -> List[str]:
+        """데이터 시각화 생성 (기본 SVG, image_format='png'이면 프로세스 풀에서 PNG 렌더링)"""
         os.makedirs(output_dir, exist_ok=True)
-        image_paths = []
         
-        # 1. 주요 지수 등락률 차트
-        fig, ax = plt.subplots(figsize=(10, 6))
         indices_df = data_dict['indices']
-        colors = ['green' if x > 0 else 'red' for x in indices_df['등락률(%)']]
-        
-        ax.barh(indices_df['지수명'], indices_df['등락률(%)'], color=colors, alpha=0.7)
-        ax.set_xlabel('Change Rate (%)', fontsize=12)
-        ax.set_title('Major Indices Performance', fontsize=14, fontweight='bold')
-        ax.axvline(x=0, color='black', linestyle='-', linewidth=0.5)
-        ax.grid(axis='x', alpha=0.3)
-        
-        plt.tight_layout()
-        path1 = f"{output_dir}/indices_performance.png"
-        plt.savefig(path1, dpi=150, bbox_inches='tight')
-        plt.close()
-        image_paths.append(path1)
-        
-        # 2. 상승 TOP 5 차트
-        fig, ax = plt.subplots(figsize=(10, 6))
         rising_df = data_dict['rising'].head(5)
-        
-        ax.barh(rising_df['종목명'], rising_df['등락률(%)'], color='#2ecc71', alpha=0.7)
-        ax.set_xlabel('Change Rate (%)', fontsize=12)
-        ax.set_title('Top 5 Rising Stocks', fontsize=14, fontweight='bold')
-        ax.grid(axis='x', alpha=0.3)
-        
-        plt.tight_layout()
-        path2 = f"{output_dir}/top_rising.png"
-        plt.savefig(path2, dpi=150, bbox_inches='tight')
-        plt.close()
-        image_paths.append(path2)
-        
-        # 3. 하락 TOP 5 차트
-        fig, ax = plt.subplots(figsize=(10, 6))
         falling_df = data_dict['falling'].head(5)
         
-        ax.barh(falling_df['종목명'], falling_df['등락률(%)'], color='#e74c3c', alpha=0.7)
-        ax.set_xlabel('Change Rate (%)', fontsize=12)
-        ax.set_title('Top 5 Falling Stocks', fontsize=14, fontweight='bold')
-        ax.grid(axis='x', alpha=0.3)
+        # (파일명, 제목, 라벨, 값, 색상, 0 기준선 여부)
+        charts = [
+            # 1. 주요 지수 등락률 차트
+            ('indices_performance',
+             'Major Indices Performance',
+             indices_df['지수명'].tolist(),
+             indices_df['등락률(%)'].tolist(),
+             ['green' if x > 0 else 'red' for x in indices_df['등락률(%)']],
+             True),
+            # 2. 상승 TOP 5 차트
+            ('top_rising',
+             'Top 5 Rising Stocks',
+             rising_df['종목명'].tolist(),
+             rising_df['등락률(%)'].tolist(),
+             '#2ecc71',
+             False),
+            # 3. 하락 TOP 5 차트
+            ('top_falling',
+             'Top 5 Falling Stocks',
+             falling_df['종목명'].tolist(),
+             falling_df['등락률(%)'].tolist(),
+             '#e74c3c',
+             False),
+        ]
+        
+        if image_format == 'png':
+            # 수집용 스레드 풀이 살아 있는 프로세스에서 fork하지 않도록 spawn 사용
+            # (프로세스 풀은 호출마다 생성되므로 기동 비용은 쿼리당 한 번 발생)
+            with ProcessPoolExecutor(max_workers=len(charts),
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                futures = [
+                    executor.submit(_render_bar_png, title, labels, values, colors,
+                                    f"{output_dir}/{name}.png", zero_line)
+                    for name, title, labels, values, colors, zero_line in charts
+                ]
+                return [future.result() for future in futures]
         
-        plt.tight_layout()
-        path3 = f"{output_dir}/top_falling.png"
-        plt.savefig(path3, dpi=150, bbox_inches='tight')
-        plt.close()
-        image_paths.append(path3)
+        image_paths = []
+        for name, title, labels, values, colors, _ in charts:
+            path = f"{output_dir}/{name}.svg"
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(bar_svg(labels, values, colors, title))
+            image_paths.append(path)
         
         return image_paths
     
@@ -237,61 +413,58 @@ class DataProcessor:
     def calculate_market_summary(data_dict: Dict) -> Dict:
         """시장 요약 통계 계산"""
         indices_df = data_dict['indices']
+        rising_rates = data_dict['rising']['등락률(%)'].to_numpy(dtype=np.float64)
+        falling_rates = data_dict['falling']['등락률(%)'].to_numpy(dtype=np.float64)
+        
+        # 종목 풀이 클 때만 JIT 커널 사용 (소규모 데이터는 컴파일 비용이 더 큼)
+        if _rate_extremes_jit is not None and rising_rates.size + falling_rates.size >= JIT_MIN_SIZE:
+            max_rising_rate, min_falling_rate = _rate_extremes_jit(rising_rates, falling_rates)
+        else:
+            max_rising_rate, min_falling_rate = _rate_extremes(rising_rates, falling_rates)
         
         summary = {
             'avg_index_change': indices_df['등락률(%)'].mean(),
-            'max_rising_rate': data_dict['rising']['등락률(%)'].max() if not data_dict['rising'].empty else 0,
-            'min_falling_rate': data_dict['falling']['등락률(%)'].min() if not data_dict['falling'].empty else 0,
-            'rising_count': len(data_dict['rising']),
-            'falling_count': len(data_dict['falling']),
+            'max_rising_rate': max_rising_rate,
+            'min_falling_rate': min_falling_rate,
+            'rising_count': rising_rates.size,
+            'falling_count': falling_rates.size,
         }
         
         return summary
 
 
-class RAGNewsletterGenerator:
-    """RAG 기반 뉴스레터 생성 클래스"""
-    
-    def __init__(self, api_key: str):
-        """
-        Args:
-            api_key: Google Gemini API 키
-        """
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    
-    def create_context(self, data_dict: Dict, summary: Dict, news_list: List[Dict]) -> str:
-        """RAG 컨텍스트 생성"""
-        context = f"""
-# 주식 시장 데이터 컨텍스트 (기준: {datetime.now().strftime("%Y년 %m월 %d일")})
+def _format_table(df: pd.DataFrame, limit: int = 10) -> str:
+    """LLM 컨텍스트용 표 문자열 생성 (정렬 없는 '|' 구분 CSV, 최대 limit행)"""
+    return df.head(limit).to_csv(index=False, sep='|', float_format='%.2f').rstrip('\n')
+
+
+# RAG 컨텍스트 / 프롬프트 템플릿
+_NEWS_FMT = "- {title}: {summary}".format
+
+_CONTEXT_TEMPLATE = """
+# 주식 시장 데이터 컨텍스트 (기준: {date})
 
 ## 1. 주요 지수 현황
-{data_dict['indices'].to_string(index=False)}
+{indices}
 
 ## 2. 상승률 상위 종목
-{data_dict['rising'].to_string(index=False)}
+{rising}
 
 ## 3. 하락률 상위 종목
-{data_dict['falling'].to_string(index=False)}
+{falling}
 
 ## 4. 시장 통계 요약
-- 평균 지수 등락률: {summary['avg_index_change']:.2f}%
-- 최대 상승률: {summary['max_rising_rate']:.2f}%
-- 최대 하락률: {summary['min_falling_rate']:.2f}%
-- 상승 종목 수: {summary['rising_count']}개
-- 하락 종목 수: {summary['falling_count']}개
+- 평균 지수 등락률: {avg_index_change:.2f}%
+- 최대 상승률: {max_rising_rate:.2f}%
+- 최대 하락률: {min_falling_rate:.2f}%
+- 상승 종목 수: {rising_count}개
+- 하락 종목 수: {falling_count}개
 
 ## 5. 주요 뉴스
+{news}
 """
-        for news in news_list:
-            context += f"- {news['title']}: {news['summary']}\n"
-        
-        return context
-    
-    def generate_newsletter(self, context: str, user_query: str) -> str:
-        """LLM을 활용한 뉴스레터 생성"""
-        
-        prompt = f"""
+
+_PROMPT_TEMPLATE = """
 당신은 금융 전문 애널리스트입니다. 아래 데이터를 기반으로 전문적이면서도 이해하기 쉬운 주식 시장 뉴스레터를 작성해주세요.
 
 사용자 질의: {user_query}
@@ -321,46 +494,119 @@ class RAGNewsletterGenerator:
 시장에 영향을 준 주요 뉴스
 
 ---
-*본 리포트는 {datetime.now().strftime("%Y년 %m월 %d일 %H:%M")} 기준으로 작성되었습니다.*
+*본 리포트는 {generated_at} 기준으로 작성되었습니다.*
 *투자 판단은 본인의 책임하에 이루어져야 합니다.*
 
 전문적이면서도 친근한 톤으로 작성하되, 구체적인 데이터를 활용해주세요.
 """
+
+
+class RAGNewsletterGenerator:
+    """RAG 기반 뉴스레터 생성 클래스"""
+    
+    def __init__(self, api_key: str):
+        """
+        Args:
+            api_key: Google Gemini API 키
+        """
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    
+    def create_context(self, data_dict: Dict, summary: Dict, news_list: List[Dict]) -> str:
+        """RAG 컨텍스트 생성"""
+        news_block = '\n'.join(_NEWS_FMT(**news) for news in news_list)
+        return _CONTEXT_TEMPLATE.format(
+            date=datetime.now().strftime("%Y년 %m월 %d일"),
+            indices=_format_table(data_dict['indices']),
+            rising=_format_table(data_dict['rising']),
+            falling=_format_table(data_dict['falling']),
+            news=news_block,
+            **summary
+        )
+    
+    def generate_newsletter(self, context: str, user_query: str,
+                            stream: bool = False) -> Union[str, Iterator[str]]:
+        """
+        LLM을 활용한 뉴스레터 생성
+        
+        Args:
+            context: RAG 컨텍스트
+            user_query: 사용자 질의
+            stream: True면 응답 조각(str)을 생성되는 대로 내보내는 이터레이터 반환
+        """
+        prompt = _PROMPT_TEMPLATE.format(
+            user_query=user_query,
+            context=context,
+            generated_at=datetime.now().strftime("%Y년 %m월 %d일 %H:%M")
+        )
+        
+        if stream:
+            return self._stream_newsletter(prompt)
         
         try:
             response = self.model.generate_content(prompt)
             return response.text
         except Exception as e:
             return f"뉴스레터 생성 중 오류 발생: {e}"
+    
+    def _stream_newsletter(self, prompt: str) -> Iterator[str]:
+        """스트리밍 응답을 텍스트 조각 단위로 반환"""
+        try:
+            for chunk in self.model.generate_content(prompt, stream=True):
+                yield chunk.text
+        except Exception as e:
+            yield f"뉴스레터 생성 중 오류 발생: {e}"
 
 
 class StockNewsletterSystem:
     """통합 시스템 클래스"""
     
-    def __init__(self, gemini_api_key: str):
+    # 쿼리 키워드 검증용 정규식 (입력 문자열을 한 번만 스캔)
+    _KEYWORD_RE = re.compile('|'.join(map(re.escape, ['오늘자', '국내', '시장', '주식'])))
+    
+    def __init__(self, gemini_api_key: str, chart_format: str = 'svg'):
+        """
+        Args:
+            gemini_api_key: Google Gemini API 키
+            chart_format: 차트 출력 형식 ('svg' 또는 'png')
+        """
+        self.chart_format = chart_format
         self.collector = StockDataCollector()
+        # 수집용 스레드 풀 (쿼리 간 재사용하여 스레드별 세션의 커넥션 유지)
+        self._executor = ThreadPoolExecutor(max_workers=4)
         self.processor = DataProcessor()
         self.generator = RAGNewsletterGenerator(gemini_api_key)
     
-    def process_query(self, user_input: str) -> Dict:
-        """사용자 쿼리 처리 메인 파이프라인"""
+    def process_query(self, user_input: str, stream: bool = False) -> Dict:
+        """
+        사용자 쿼리 처리 메인 파이프라인
+        
+        Args:
+            user_input: 사용자 질의
+            stream: True면 result['newsletter']가 응답 조각 이터레이터가 되며,
+                    실제 생성은 save_newsletter()에서 조각을 받는 대로 진행됨
+        """
         
         # 키워드 검증
-        keywords = ['오늘자', '국내', '시장', '주식']
-        if not any(keyword in user_input for keyword in keywords):
+        if not self._KEYWORD_RE.search(user_input):
             return {
                 'success': False,
                 'message': '올바른 키워드를 입력해주세요. 예: "오늘자 국내 시장"'
             }
         
-        print("🔄 1단계: 데이터 수집 중...")
-        # 1. 데이터 수집
-        market_indices = self.collector.collect_market_indices()
-        rising_stocks = self.collector.collect_top_stocks('rise')
-        falling_stocks = self.collector.collect_top_stocks('fall')
-        news_list = self.collector.collect_market_news()
+        logger.info("🔄 1단계: 데이터 수집 중...")
+        # 1. 데이터 수집 (독립적인 HTTP 요청이므로 병렬 실행)
+        f_indices = self._executor.submit(self.collector.collect_market_indices)
+        f_rising = self._executor.submit(self.collector.collect_top_stocks, 'rise')
+        f_falling = self._executor.submit(self.collector.collect_top_stocks, 'fall')
+        f_news = self._executor.submit(self.collector.collect_market_news)
+        
+        market_indices = f_indices.result()
+        rising_stocks = f_rising.result()
+        falling_stocks = f_falling.result()
+        news_list = f_news.result()
         
-        print("🔄 2단계: 데이터 정제 및 분석 중...")
+        logger.info("🔄 2단계: 데이터 정제 및 분석 중...")
         # 2. 데이터 정제
         processed_data = self.processor.process_market_data(
             market_indices, rising_stocks, falling_stocks
@@ -369,16 +615,21 @@ class StockNewsletterSystem:
         # 3. 통계 분석
         summary = self.processor.calculate_market_summary(processed_data)
         
-        print("🔄 3단계: 시각화 생성 중...")
+        logger.info("🔄 3단계: 시각화 생성 중...")
         # 4. 시각화
-        image_paths = self.processor.create_visualizations(processed_data)
+        image_paths = self.processor.create_visualizations(
+            processed_data, image_format=self.chart_format
+        )
         
-        print("🔄 4단계: RAG 기반 뉴스레터 생성 중...")
+        if stream:
+            logger.info("🔄 4단계: RAG 컨텍스트 생성 중 (뉴스레터는 저장 시 스트리밍 생성)...")
+        else:
+            logger.info("🔄 4단계: RAG 기반 뉴스레터 생성 중...")
         # 5. RAG 컨텍스트 생성
         context = self.generator.create_context(processed_data, summary, news_list)
         
         # 6. LLM 뉴스레터 생성
-        newsletter = self.generator.generate_newsletter(context, user_input)
+        newsletter = self.generator.generate_newsletter(context, user_input, stream=stream)
         
         return {
             'success': True,
@@ -389,23 +640,51 @@ class StockNewsletterSystem:
             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
     
-    def save_newsletter(self, result: Dict, output_path: str = '/mnt/user-data/outputs/newsletter.md'):
-        """뉴스레터를 파일로 저장"""
+    def save_newsletter(self, result: Dict, output_path: str = '/mnt/user-data/outputs/newsletter.md',
+                        on_chunk: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        뉴스레터를 파일로 저장
+        
+        스트리밍 응답이면 조각을 받는 대로 파일에 기록하고, 완료 후
+        result['newsletter']를 전체 텍스트로 교체하여 반환합니다.
+        
+        Args:
+            result: process_query 결과
+            output_path: 저장할 마크다운 파일 경로
+            on_chunk: 각 텍스트 조각을 기록할 때마다 호출할 콜백 (예: 콘솔 출력)
+        """
         if not result['success']:
-            return
+            return None
+        
+        newsletter = result['newsletter']
+        chunks = [newsletter] if isinstance(newsletter, str) else newsletter
+        parts = []
         
         with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(result['newsletter'])
+            for text in chunks:
+                f.write(text)
+                f.flush()
+                parts.append(text)
+                if on_chunk:
+                    on_chunk(text)
             f.write("\n\n---\n\n")
             f.write("## 📊 데이터 시각화\n\n")
             for img_path in result['images']:
                 f.write(f"![Chart]({img_path})\n\n")
         
-        print(f"✅ 뉴스레터가 저장되었습니다: {output_path}")
+        result['newsletter'] = ''.join(parts)
+        logger.info("✅ 뉴스레터가 저장되었습니다: %s", output_path)
+        return result['newsletter']
+    
+    def close(self):
+        """수집용 스레드 풀 종료"""
+        self._executor.shutdown(wait=True)
 
 
 def main():
     """메인 실행 함수"""
+    # 로깅 설정 (진행 상황은 print 대신 로거로 출력)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     
     print("=" * 60)
     print("📈 주식 시장 RAG 기반 뉴스레터 시스템")
@@ -433,22 +712,24 @@ def main():
             continue
         
         # 쿼리 처리
-        result = system.process_query(user_input)
+        result = system.process_query(user_input, stream=True)
         
         if result['success']:
             print("\n" + "=" * 60)
-            print("✅ 뉴스레터 생성 완료!")
+            print("📝 뉴스레터 생성 중...")
             print("=" * 60)
-            print(result['newsletter'])
             
-            # 파일 저장
-            system.save_newsletter(result)
+            # 파일 저장 (응답을 받는 대로 파일 기록과 콘솔 출력을 함께 진행)
+            system.save_newsletter(result, on_chunk=lambda text: print(text, end='', flush=True))
+            print("\n\n✅ 뉴스레터 생성 완료!")
             
             print("\n📊 생성된 차트:")
             for img in result['images']:
                 print(f"  - {img}")
         else:
             print(f"\n❌ {result['message']}")
+    
+    system.close()
 
 
 if __name__ == "__main__":
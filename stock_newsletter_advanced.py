@@ -3,30 +3,42 @@
 추가 기능: 캐싱, 로깅, 설정 파일, 에러 복구
 """
 
+import io
 import os
 import json
 import logging
-from datetime import datetime, timedelta
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 from pathlib import Path
 from typing import Dict, List, Optional
 import pickle
 
+import msgpack
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # 비대화형 백엔드 (GUI 백엔드 탐색 생략)
 import matplotlib.pyplot as plt
 import google.generativeai as genai
 
-# 로깅 설정
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('/home/claude/stock_newsletter.log'),
-        logging.StreamHandler()
-    ]
-)
+try:
+    import orjson
+except ImportError:  # orjson 미설치 시 표준 json 모듈 사용
+    orjson = None
+
+# 로깅 설정 (핸들러 구성은 main()에서, 라이브러리로 사용 시 호출 측 설정을 따름)
 logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# PNG 저장 옵션 (뉴스레터용 차트는 낮은 압축 수준으로 인코딩 시간 단축)
+PNG_SAVE_KWARGS = {'compress_level': 1, 'optimize': False}
 
 
 class Config:
@@ -41,6 +53,7 @@ class Config:
         "gemini_model": "gemini-2.0-flash-exp",
         "top_stocks_count": 10,
         "news_count": 5,
+        "query_keywords": ["오늘자", "국내", "시장", "주식"],
     }
     
     def __init__(self, config_path: str = "/home/claude/config.json"):
@@ -51,34 +64,45 @@ class Config:
         """설정 파일 로드"""
         if os.path.exists(self.config_path):
             try:
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    user_config = json.load(f)
-                    return {**self.DEFAULT_CONFIG, **user_config}
+                raw = Path(self.config_path).read_bytes()
+                user_config = orjson.loads(raw) if orjson else json.loads(raw)
+                return {**self.DEFAULT_CONFIG, **user_config}
             except Exception as e:
-                logger.warning(f"설정 파일 로드 실패, 기본값 사용: {e}")
+                logger.warning("설정 파일 로드 실패, 기본값 사용: %s", e)
         return self.DEFAULT_CONFIG.copy()
     
     def save_config(self):
         """설정 파일 저장"""
         try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
+            if orjson:
+                Path(self.config_path).write_bytes(orjson.dumps(
+                    self.config, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+                ))
+            else:
+                with open(self.config_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.config, f, indent=2, ensure_ascii=False)
             logger.info("설정 파일 저장 완료")
         except Exception as e:
-            logger.error(f"설정 파일 저장 실패: {e}")
+            logger.error("설정 파일 저장 실패: %s", e)
     
     def get(self, key: str, default=None):
         """설정값 조회"""
         return self.config.get(key, default)
 
 
+# 캐시 파일 포맷 태그 (파일 첫 바이트에 기록)
+CACHE_FORMAT_FEATHER = b'F'
+CACHE_FORMAT_MSGPACK = b'M'
+CACHE_FORMAT_PICKLE = b'P'
+
+
 class CacheManager:
     """캐시 관리 클래스"""
     
     def __init__(self, cache_dir: str, duration_minutes: int = 30):
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.duration = timedelta(minutes=duration_minutes)
+        self.duration_seconds = duration_minutes * 60.0
     
     def get_cache_path(self, key: str) -> Path:
         """캐시 파일 경로 생성"""
@@ -86,13 +110,12 @@ class CacheManager:
     
     def is_valid(self, key: str) -> bool:
         """캐시 유효성 검증"""
-        cache_path = self.get_cache_path(key)
-        if not cache_path.exists():
+        # 파일 수정 시간 확인 (stat 한 번으로 존재 여부까지 판단)
+        try:
+            mtime = self.get_cache_path(key).stat().st_mtime
+        except FileNotFoundError:
             return False
-        
-        # 파일 수정 시간 확인
-        mtime = datetime.fromtimestamp(cache_path.stat().st_mtime)
-        return datetime.now() - mtime < self.duration
+        return time.time() - mtime < self.duration_seconds
     
     def get(self, key: str) -> Optional[any]:
         """캐시 데이터 조회"""
@@ -102,20 +125,65 @@ class CacheManager:
         try:
             cache_path = self.get_cache_path(key)
             with open(cache_path, 'rb') as f:
-                return pickle.load(f)
+                fmt = f.read(1)
+                payload = f.read()
+            
+            if fmt == CACHE_FORMAT_FEATHER:
+                return pd.read_feather(io.BytesIO(payload))
+            if fmt == CACHE_FORMAT_MSGPACK:
+                return msgpack.unpackb(payload, strict_map_key=False)
+            if fmt == CACHE_FORMAT_PICKLE:
+                return pickle.loads(payload)
+            raise ValueError(f"알 수 없는 캐시 포맷: {fmt!r}")
         except Exception as e:
-            logger.warning(f"캐시 로드 실패: {e}")
+            logger.warning("캐시 로드 실패: %s", e)
             return None
     
+    @staticmethod
+    def _serialize(data: any) -> tuple:
+        """캐시 포맷 선택 및 직렬화 (feather/msgpack으로 원형 복원이 안 되면 pickle 사용)"""
+        if isinstance(data, pd.DataFrame):
+            # DataFrame은 컬럼 형식(feather)으로 저장
+            try:
+                buffer = io.BytesIO()
+                data.to_feather(buffer)
+                return CACHE_FORMAT_FEATHER, buffer.getvalue()
+            except (ValueError, TypeError):
+                pass  # 문자열이 아닌 컬럼명 등 feather가 지원하지 않는 DataFrame
+        else:
+            # msgpack은 튜플을 리스트로 바꾸는 등 타입이 달라질 수 있으므로 복원 결과를 확인
+            try:
+                payload = msgpack.packb(data)
+                if msgpack.unpackb(payload, strict_map_key=False) == data:
+                    return CACHE_FORMAT_MSGPACK, payload
+            except (ValueError, TypeError, OverflowError):
+                pass
+        
+        return CACHE_FORMAT_PICKLE, pickle.dumps(data)
+    
     def set(self, key: str, data: any):
         """캐시 데이터 저장"""
         try:
             cache_path = self.get_cache_path(key)
+            fmt, payload = self._serialize(data)
+            
             with open(cache_path, 'wb') as f:
-                pickle.dump(data, f)
-            logger.info(f"캐시 저장 완료: {key}")
+                f.write(fmt)
+                f.write(payload)
+            logger.info("캐시 저장 완료: %s", key)
+            self._purge_expired()
         except Exception as e:
-            logger.error(f"캐시 저장 실패: {e}")
+            logger.error("캐시 저장 실패: %s", e)
+    
+    def _purge_expired(self):
+        """만료된 캐시 파일 삭제 (날짜별 키는 다시 조회되지 않으므로 저장 시 정리)"""
+        now = time.time()
+        for cache_file in self.cache_dir.glob("*.cache"):
+            try:
+                if now - cache_file.stat().st_mtime >= self.duration_seconds:
+                    cache_file.unlink()
+            except FileNotFoundError:
+                pass  # 다른 스레드가 먼저 삭제한 경우
     
     def clear(self, key: Optional[str] = None):
         """캐시 삭제"""
@@ -127,7 +195,18 @@ class CacheManager:
             # 모든 캐시 삭제
             for cache_file in self.cache_dir.glob("*.cache"):
                 cache_file.unlink()
-        logger.info(f"캐시 삭제 완료: {key or 'all'}")
+        logger.info("캐시 삭제 완료: %s", key or 'all')
+
+
+def top_k_by_rate(arr: np.ndarray, k: int, ascending: bool = False) -> np.ndarray:
+    """등락률 배열에서 상위 k개 인덱스를 정렬된 순서로 반환 (부분 정렬, O(N + k log k))"""
+    keys = arr if ascending else -arr
+    k = min(k, keys.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    
+    idx = np.argpartition(keys, k - 1)[:k]
+    return idx[np.argsort(keys[idx])]
 
 
 class EnhancedStockDataCollector:
@@ -140,44 +219,60 @@ class EnhancedStockDataCollector:
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+        # 스레드별 세션 (병렬 수집 시 커넥션 재사용)
+        self._local = threading.local()
     
-    def _fetch_with_retry(self, url: str, cache_key: str) -> Optional[BeautifulSoup]:
+    @property
+    def session(self) -> requests.Session:
+        """현재 스레드 전용 HTTP 세션 (커넥션 풀 + 재시도 정책 적용)"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=8,
+                pool_maxsize=16,
+                max_retries=Retry(
+                    total=self.config.get('max_retries', 3),
+                    backoff_factor=0.3,
+                    status_forcelist=(500, 502, 503, 504)
+                )
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._local.session = session
+        return session
+    
+    @staticmethod
+    def daily_cache_key(prefix: str) -> str:
+        """날짜별 캐시 키 생성 (전날 데이터는 자동으로 무효화)"""
+        return f"{prefix}_{date.today().isoformat()}"
+    
+    def _fetch_with_retry(self, url: str) -> Optional[BeautifulSoup]:
         """재시도 로직이 포함된 HTTP 요청"""
-        
-        # 캐시 확인
-        cached_data = self.cache.get(cache_key)
-        if cached_data:
-            logger.info(f"캐시 사용: {cache_key}")
-            return cached_data
-        
-        max_retries = self.config.get('max_retries', 3)
         timeout = self.config.get('timeout_seconds', 10)
         
-        for attempt in range(max_retries):
-            try:
-                response = requests.get(url, headers=self.headers, timeout=timeout)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # 캐시 저장
-                self.cache.set(cache_key, soup)
-                logger.info(f"데이터 수집 성공: {cache_key}")
-                return soup
-                
-            except requests.RequestException as e:
-                logger.warning(f"시도 {attempt + 1}/{max_retries} 실패: {e}")
-                if attempt == max_retries - 1:
-                    logger.error(f"최종 실패: {url}")
-                    return None
-        
-        return None
+        # 재시도는 세션 어댑터의 Retry 정책이 처리
+        try:
+            response = self.session.get(url, headers=self.headers, timeout=timeout)
+            response.raise_for_status()
+            soup = BeautifulSoup(response.content, 'lxml')
+            logger.info("데이터 수집 성공: %s", url)
+            return soup
+            
+        except requests.RequestException as e:
+            logger.error("최종 실패: %s (%s)", url, e)
+            return None
     
-    def collect_market_indices(self) -> List[Dict]:
+    def collect_market_indices(self) -> pd.DataFrame:
         """주요 지수 정보 수집 (개선된 버전)"""
-        soup = self._fetch_with_retry(
-            f"{self.base_url}/index.naver",
-            "market_indices"
-        )
+        # 캐시 확인 (파싱된 결과를 캐싱)
+        cache_key = self.daily_cache_key("indices")
+        cached_data = self.cache.get(cache_key)
+        if cached_data is not None:
+            logger.info("캐시 사용: %s", cache_key)
+            return cached_data
+        
+        soup = self._fetch_with_retry(f"{self.base_url}/index.naver")
         
         if not soup:
             logger.error("지수 데이터 수집 실패")
@@ -185,41 +280,50 @@ class EnhancedStockDataCollector:
         
         # 실제 파싱 로직은 네이버 증권의 HTML 구조에 맞춰 구현
         # 여기서는 예시 데이터 반환
-        return self._get_fallback_indices()
+        indices = self._get_fallback_indices()
+        self.cache.set(cache_key, indices)
+        return indices
     
-    def _get_fallback_indices(self) -> List[Dict]:
+    def _get_fallback_indices(self) -> pd.DataFrame:
         """폴백 데이터 (수집 실패 시)"""
         logger.info("폴백 데이터 사용")
-        return [
-            {
-                "index_name": "KOSPI",
-                "current_value": 2500.0,
-                "change_value": 10.5,
-                "change_rate": 0.42,
-                "timestamp": datetime.now().isoformat()
-            },
-            {
-                "index_name": "KOSDAQ",
-                "current_value": 850.0,
-                "change_value": -5.2,
-                "change_rate": -0.61,
-                "timestamp": datetime.now().isoformat()
-            }
-        ]
+        timestamp = datetime.now().isoformat()
+        return pd.DataFrame({
+            "index_name": np.array(["KOSPI", "KOSDAQ"], dtype=object),
+            "current_value": np.array([2500.0, 850.0]),
+            "change_value": np.array([10.5, -5.2]),
+            "change_rate": np.array([0.42, -0.61]),
+            "timestamp": timestamp
+        })
     
-    def collect_top_stocks(self, category: str = 'rise') -> List[Dict]:
+    def collect_top_stocks(self, category: str = 'rise') -> pd.DataFrame:
         """상승/하락 상위 종목 수집"""
-        cache_key = f"top_stocks_{category}"
+        cache_key = self.daily_cache_key(f"top_stocks_{category}")
+        cached_data = self.cache.get(cache_key)
+        if cached_data is not None:
+            logger.info("캐시 사용: %s", cache_key)
+            return cached_data
         
         # 실제 구현에서는 웹 스크래핑 로직 추가
-        # 여기서는 예시 데이터
-        sample_stocks = [
-            {"rank": i+1, "name": f"종목{i+1}", "current_price": 50000 + i*1000,
-             "change_rate": 5.0 - i*0.3, "category": category}
-            for i in range(self.config.get('top_stocks_count', 10))
-        ]
+        # 여기서는 예시 데이터 (컬럼 단위 배열로 직접 구성)
+        n = self.config.get('top_stocks_count', 10)
+        pool_ids = np.arange(1, n + 1, dtype=np.int64)
+        names = np.array([f"종목{i}" for i in pool_ids], dtype=object)
+        prices = 49000 + pool_ids * 1000
+        rates = 5.0 - (pool_ids - 1) * 0.3
+        
+        # 상위 N개 선택 (하락 종목은 등락률 오름차순)
+        top = top_k_by_rate(rates, n, ascending=(category == 'fall'))
+        stocks = pd.DataFrame({
+            "rank": np.arange(1, top.size + 1, dtype=np.int64),
+            "name": names[top],
+            "current_price": prices[top],
+            "change_rate": rates[top],
+            "category": category
+        })
         
-        return sample_stocks
+        self.cache.set(cache_key, stocks)
+        return stocks
     
     def collect_market_news(self) -> List[Dict]:
         """시장 주요 뉴스 수집"""
@@ -232,6 +336,11 @@ class EnhancedStockDataCollector:
         ]
 
 
+def _format_table(df: pd.DataFrame, limit: int) -> str:
+    """LLM 컨텍스트용 표 문자열 생성 (정렬 없는 '|' 구분 CSV, 최대 limit행)"""
+    return df.head(limit).to_csv(index=False, sep='|', float_format='%.2f').rstrip('\n')
+
+
 class AdvancedStockNewsletterSystem:
     """고급 통합 시스템"""
     
@@ -242,6 +351,10 @@ class AdvancedStockNewsletterSystem:
             self.config.get('cache_duration_minutes')
         )
         self.collector = EnhancedStockDataCollector(self.config, self.cache)
+        # 수집용 스레드 풀 (쿼리 간 재사용하여 스레드별 세션의 커넥션 유지)
+        self._executor = ThreadPoolExecutor(max_workers=4)
+        self._keywords = None
+        self._keyword_re = None
         
         # Gemini 설정
         genai.configure(api_key=gemini_api_key)
@@ -249,16 +362,43 @@ class AdvancedStockNewsletterSystem:
         
         logger.info("시스템 초기화 완료")
     
+    def _get_keyword_pattern(self) -> re.Pattern:
+        """쿼리 키워드 정규식 조회 (설정의 키워드 목록이 바뀐 경우에만 재컴파일,
+        문자열 리스트가 아니면 기본 키워드 사용)"""
+        keywords = self.config.get('query_keywords')
+        if (not isinstance(keywords, (list, tuple)) or not keywords
+                or not all(isinstance(k, str) and k for k in keywords)):
+            logger.warning("잘못된 query_keywords 설정, 기본값 사용: %r", keywords)
+            keywords = Config.DEFAULT_CONFIG['query_keywords']
+        keywords = tuple(keywords)
+        if keywords != self._keywords:
+            self._keyword_re = re.compile('|'.join(map(re.escape, keywords)))
+            self._keywords = keywords
+        return self._keyword_re
+    
     def process_query(self, user_input: str) -> Dict:
         """사용자 쿼리 처리 (향상된 버전)"""
+        # 키워드 검증
+        if not self._get_keyword_pattern().search(user_input):
+            return {
+                'success': False,
+                'error': '올바른 키워드를 입력해주세요. 예: "오늘자 국내 시장"',
+                'timestamp': datetime.now().isoformat()
+            }
+        
         try:
-            logger.info(f"쿼리 처리 시작: {user_input}")
+            logger.info("쿼리 처리 시작: %s", user_input)
+            
+            # 1. 데이터 수집 (독립적인 HTTP 요청이므로 병렬 실행)
+            f_indices = self._executor.submit(self.collector.collect_market_indices)
+            f_rising = self._executor.submit(self.collector.collect_top_stocks, 'rise')
+            f_falling = self._executor.submit(self.collector.collect_top_stocks, 'fall')
+            f_news = self._executor.submit(self.collector.collect_market_news)
             
-            # 1. 데이터 수집
-            indices = self.collector.collect_market_indices()
-            rising = self.collector.collect_top_stocks('rise')
-            falling = self.collector.collect_top_stocks('fall')
-            news = self.collector.collect_market_news()
+            indices = f_indices.result()
+            rising = f_rising.result()
+            falling = f_falling.result()
+            news = f_news.result()
             
             # 2. 데이터 처리
             processed = self._process_data(indices, rising, falling)
@@ -274,26 +414,29 @@ class AdvancedStockNewsletterSystem:
                 'newsletter': newsletter,
                 'images': images,
                 'timestamp': datetime.now().isoformat(),
-                'cached_data': self.cache.is_valid('market_indices')
+                'cached_data': self.cache.is_valid(
+                    self.collector.daily_cache_key('indices')
+                )
             }
             
             logger.info("쿼리 처리 완료")
             return result
             
         except Exception as e:
-            logger.error(f"쿼리 처리 중 오류: {e}", exc_info=True)
+            logger.error("쿼리 처리 중 오류: %s", e, exc_info=True)
             return {
                 'success': False,
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
             }
     
-    def _process_data(self, indices, rising, falling) -> Dict:
-        """데이터 처리"""
+    def _process_data(self, indices: pd.DataFrame, rising: pd.DataFrame,
+                      falling: pd.DataFrame) -> Dict:
+        """데이터 처리 (수집 단계에서 이미 컬럼 단위로 구성됨)"""
         return {
-            'indices': pd.DataFrame(indices),
-            'rising': pd.DataFrame(rising),
-            'falling': pd.DataFrame(falling)
+            'indices': indices,
+            'rising': rising,
+            'falling': falling
         }
     
     def _create_visualizations(self, data_dict: Dict) -> List[str]:
@@ -310,14 +453,14 @@ class AdvancedStockNewsletterSystem:
                 ax.bar(data_dict['indices']['index_name'], 
                        data_dict['indices']['change_rate'])
                 ax.set_title('Market Indices Performance')
-                plt.tight_layout()
+                fig.tight_layout()
                 
                 path = f"{output_dir}/indices_chart.png"
-                plt.savefig(path, dpi=150)
-                plt.close()
+                fig.savefig(path, dpi=100, pil_kwargs=PNG_SAVE_KWARGS)
                 images.append(path)
+            plt.close(fig)
         except Exception as e:
-            logger.error(f"시각화 오류: {e}")
+            logger.error("시각화 오류: %s", e)
         
         return images
     
@@ -341,27 +484,40 @@ class AdvancedStockNewsletterSystem:
             return response.text
             
         except Exception as e:
-            logger.error(f"뉴스레터 생성 오류: {e}")
+            logger.error("뉴스레터 생성 오류: %s", e)
             return f"뉴스레터 생성 중 오류 발생: {e}"
     
     def _create_context(self, data: Dict, news: List) -> str:
         """RAG 컨텍스트 생성"""
-        context = f"### 시장 지수\n{data['indices'].to_string()}\n\n"
-        context += f"### 상승 종목\n{data['rising'].head().to_string()}\n\n"
-        context += f"### 하락 종목\n{data['falling'].head().to_string()}\n\n"
+        context = f"### 시장 지수\n{_format_table(data['indices'], 10)}\n\n"
+        context += f"### 상승 종목\n{_format_table(data['rising'], 5)}\n\n"
+        context += f"### 하락 종목\n{_format_table(data['falling'], 5)}\n\n"
         context += "### 주요 뉴스\n"
-        for item in news:
-            context += f"- {item['title']}\n"
+        context += ''.join(f"- {item['title']}\n" for item in news)
         return context
     
     def clear_cache(self):
         """캐시 초기화"""
         self.cache.clear()
         logger.info("모든 캐시 삭제 완료")
+    
+    def close(self):
+        """수집용 스레드 풀 종료"""
+        self._executor.shutdown(wait=True)
 
 
 def main():
     """메인 실행 함수"""
+    # 로깅 설정
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('/home/claude/stock_newsletter.log'),
+            logging.StreamHandler()
+        ]
+    )
+    
     print("=" * 60)
     print("📈 고급 주식 시장 RAG 뉴스레터 시스템")
     print("=" * 60)
@@ -397,6 +553,8 @@ def main():
                 print("\n💾 캐시된 데이터 사용됨")
         else:
             print(f"\n❌ 오류: {result.get('error')}")
+    
+    system.close()
 
 
 if __name__ == "__main__":